@@ -1,10 +1,14 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import plotly.graph_objects as go
+import plotly.io as pio
+import pyarrow as pa
 from datetime import datetime
-import time
 from PIL import Image
 import base64
+import os
+import tempfile
 from io import BytesIO
 
 # st.set_page_config() must be the first Streamlit command.
@@ -20,106 +24,212 @@ LOGO_FILE = "logo.png" # The logo should be in the main folder, along with the s
 START = datetime(2025, 4, 1)
 END   = datetime(2026, 3, 31)
 
+DELAY = 15 # Seconds each TV Mode view stays on screen.
+
+# TV Mode views as (title, source, categoria, cumulative); 'source' is "budg" or "aum", the workbook
+# the category comes from. Charts are looked up in the figure cache when shown.
+VIEWS = [
+    ("AuM (BRL)", "aum", "AuM at the EoP", False),
+    ("Revenues inc. CDBs (BRL)", "budg", "Revenues - Net of ECL", False),
+    ("Profit Before Taxes (BRL)", "budg", "PROFIT BEFORE TAX", False),
+]
+
 # === DATA LOADING FUNCTIONS (CACHE) ===
-@st.cache_data
-def load_data():
+COLUMNS = ["Data", "Categoria", "Natureza do Dado", "Budget", "Actual/Est"]
+# Bump when the columns or dtypes written to the Parquet cache change, so old caches are not reused.
+CACHE_FORMAT = 2
+
+def _excel_to_parquet(xlsx_path, parquet_path):
+    """Reads an Excel file through a Parquet copy, keeping only rows between START and END."""
+    if os.path.exists(parquet_path) and os.path.getmtime(parquet_path) >= os.path.getmtime(xlsx_path):
+        try:
+            return pd.read_parquet(parquet_path, engine="pyarrow", filters=[("Data", ">=", START), ("Data", "<=", END)])
+        except (OSError, pa.ArrowException):
+            pass # Truncated or corrupt cache: rebuild it from the workbook below.
+    # float32 is plenty for the 1-decimal M/K labels and halves the bytes through groupby/cumsum.
+    df = pd.read_excel(xlsx_path, engine="calamine", usecols=COLUMNS,
+                       dtype={"Budget": "float32", "Actual/Est": "float32"}, parse_dates=["Data"])
+    # The Parquet copy is only a speed-up, so failing to write it never breaks loading: it is written to
+    # a temp file and swapped in, and on a read-only folder or a column pyarrow can't convert the
+    # workbook frame is used directly.
+    tmp_path = None
+    try:
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(parquet_path), suffix=".tmp")
+        os.close(fd)
+        df.to_parquet(tmp_path, engine="pyarrow", compression="zstd")
+        os.replace(tmp_path, parquet_path)
+        tmp_path = None
+    except (OSError, pa.ArrowException):
+        pass
+    finally:
+        if tmp_path is not None:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+    return df[(df["Data"] >= START) & (df["Data"] <= END)].reset_index(drop=True)
+
+def _parquet_path(file):
+    """Returns the path of the Parquet cache for a file in the 'data_base' subfolder."""
+    return f"{DATA_FOLDER}/{os.path.splitext(file)[0]}.v{CACHE_FORMAT}.parquet"
+
+def data_version():
+    """Returns the latest modification time of the source files, used to invalidate the caches."""
+    return max(os.path.getmtime(f"{DATA_FOLDER}/{file}") for file in (BUDGET_FILE, AUM_FILE))
+
+@st.cache_data(max_entries=2)
+def load_data(version=None):
+    # 'version' is only part of the cache key: pass data_version() to reload when the files change.
     # Paths are adjusted to use the 'data_base' subfolder.
-    df_budg = pd.read_excel(f"{DATA_FOLDER}/{BUDGET_FILE}")
-    df_aum  = pd.read_excel(f"{DATA_FOLDER}/{AUM_FILE}")
-    df_budg['Data'] = pd.to_datetime(df_budg['Data'])
-    df_aum['Data'] = pd.to_datetime(df_aum['Data'])
-    df_budg = df_budg[(df_budg["Data"] >= START) & (df_budg["Data"] <= END)]
-    df_aum  = df_aum[(df_aum["Data"] >= START) & (df_aum["Data"] <= END)]
+    # Rows outside [START, END] are dropped by the Parquet reader itself.
+    df_budg = _excel_to_parquet(f"{DATA_FOLDER}/{BUDGET_FILE}", _parquet_path(BUDGET_FILE))
+    df_aum  = _excel_to_parquet(f"{DATA_FOLDER}/{AUM_FILE}", _parquet_path(AUM_FILE))
+    for df in (df_budg, df_aum):
+        for col in ("Categoria", "Natureza do Dado"):
+            df[col] = df[col].astype("category")
     
-    aum_mask = df_aum["Categoria"] == "AuM at the EoP"
-    df_aum.loc[aum_mask, ["Budget", "Actual/Est"]] *= 1000000
+    # Scaling runs on plain NumPy buffers with where= masks instead of .loc fancy indexing.
+    aum_mask = (df_aum["Categoria"] == "AuM at the EoP").to_numpy()
+    mask = (df_aum["Categoria"] == "Disbursement").to_numpy()
+    for col in ("Budget", "Actual/Est"):
+        values = df_aum[col].to_numpy(copy=True)
+        np.multiply(values, 1000000, out=values, where=aum_mask)
+        np.multiply(values, -1, out=values, where=mask)
+        df_aum[col] = values
+    return {"budg": aggregate_series(df_budg), "aum": aggregate_series(df_aum)}
+
+def aggregate_series(df):
+    """Pre-computes the monthly and cumulative Actual, Forecast and Budget series of every category."""
+    # dropna=False keeps rows with a blank Natureza do Dado as their own group, so they still count towards Budget.
+    agg = df.groupby(["Categoria", "Natureza do Dado", "Data"], observed=True, dropna=False)[["Budget", "Actual/Est"]].sum().sort_index()
+    # Budget is summed over every data nature from the already-grouped rows, not from df again.
+    budget = agg["Budget"].groupby(level=["Categoria", "Data"], observed=True).sum()
+    series = {}
+    for categoria in agg.index.unique(level="Categoria").dropna(): # Rows with a blank Categoria have no chart.
+        d = agg.xs(categoria, level="Categoria")
+        natureza = d.index.unique(level="Natureza do Dado")
+        monthly = {"Budget": budget.xs(categoria, level="Categoria")}
+        for kind in ("Actual", "Forecast"):
+            if kind in natureza:
+                monthly[kind] = d["Actual/Est"].xs(kind, level="Natureza do Dado")
+            else:
+                monthly[kind] = pd.Series(dtype="float32")
+        for kind, data in monthly.items():
+            series[(categoria, kind, False)] = data
+            series[(categoria, kind, True)] = data.cumsum()
+    return series
 
-    mask = df_aum["Categoria"] == "Disbursement"
-    df_aum.loc[mask, ["Budget", "Actual/Est"]] *= -1
-    return df_budg, df_aum
+@st.cache_resource(show_spinner=False)
+def load_logo(file, width=150):
+    """Loads an image and resizes it to the given width, keeping the aspect ratio."""
+    logo = Image.open(file)
+    if logo.width == width:
+        logo.load() # Read the pixels now so the cached Image doesn't hold the file open.
+        return logo
+    if logo.width > width:
+        # thumbnail() shrinks in place and keeps the aspect ratio; the height bound is never the limit.
+        logo.thumbnail((width, 10**6), Image.LANCZOS)
+        return logo
+    aspect_ratio = logo.width / logo.height
+    new_height = int(width / aspect_ratio)
+    return logo.resize((width, new_height), Image.LANCZOS)
 
 def display_logo(width=150):
     """Tries to load and display the logo, resizing it."""
     try:
-        logo = Image.open(LOGO_FILE)
-        aspect_ratio = logo.width / logo.height
-        new_height = int(width / aspect_ratio)
-        resized_logo = logo.resize((width, new_height))
-        st.image(resized_logo)
+        st.image(load_logo(LOGO_FILE, width))
     except FileNotFoundError:
         st.warning(f"Logo file '{LOGO_FILE}' not found. Please place it in the same folder as the script.")
 
 # === VISUALIZATION FUNCTIONS ===
 # === VISUALIZATION FUNCTIONS ===
+@st.cache_resource(show_spinner=False)
+def _register_chart_template():
+    """Registers the shared "dash" Plotly template, so bar_compare traces only carry their data.
+
+    pio.templates lives for the whole process, so this runs once rather than on every rerun; editing
+    this function changes its cache key and registers the template again.
+    """
+    # Bar colours stay on the traces: template bar styles cycle by trace order, and the Actual trace
+    # is left out when there is no actual data yet.
+    pio.templates["dash"] = go.layout.Template(
+        data={
+            "bar": [go.Bar(textposition='inside', textangle=0, insidetextanchor='middle',
+                           textfont=dict(color='white', size=14))],
+            "scatter": [go.Scatter(mode="lines", line=dict(color="black", width=2, dash="dash"))],
+        },
+        layout=go.Layout(
+            barmode="overlay",
+            xaxis=dict(title=dict(text="Month"), tickformat="%b/%y", showgrid=False),
+            yaxis=dict(visible=False, showgrid=False),
+            legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1),
+            annotationdefaults=dict(showarrow=False, yshift=15, font=dict(color="black", size=12),
+                                    bgcolor="rgba(255, 255, 255, 0.6)", borderpad=2),
+        ),
+    )
+    # Importing streamlit already made "streamlit" the default; layer on it.
+    pio.templates.default = "streamlit+dash"
+
+_register_chart_template()
+
 # <<< MUDANÇA: A função agora aceita um parâmetro 'decimals' para controlar o arredondamento >>>
-def format_number(num, decimals=1):
-    """Formats a number into a compact string (e.g., 1.5M, 500K)."""
-    if abs(num) >= 1_000_000:
-        return f'{num / 1_000_000:.{decimals}f}M'
-    if abs(num) >= 1_000:
-        return f'{num / 1_000:.0f}K'
-    return f'{num:.0f}'
-
-def bar_compare(df, categoria, title="", key=None, cumulative=False):
-    d = df[df["Categoria"] == categoria].copy()
-    budget_data = d.groupby('Data')['Budget'].sum().sort_index()
-    actual_data = d[d['Natureza do Dado'] == 'Actual'].groupby('Data')['Actual/Est'].sum().sort_index()
-    forecast_data = d[d['Natureza do Dado'] == 'Forecast'].groupby('Data')['Actual/Est'].sum().sort_index()
-
-    if cumulative:
-        budget_data = budget_data.cumsum()
-        actual_data = actual_data.cumsum()
-        forecast_data = forecast_data.cumsum()
+def _format_series(arr, decimals=1):
+    """Formats an array of numbers into compact strings (e.g., 1.5M, 500K) in a single vectorized pass."""
+    arr = np.asarray(arr, dtype="float64")
+    magnitude = np.abs(arr)
+    millions = np.char.mod(f"%.{decimals}fM", arr / 1_000_000)
+    thousands = np.char.mod("%.0fK", arr / 1_000)
+    units = np.char.mod("%.0f", arr)
+    return np.where(magnitude >= 1_000_000, millions, np.where(magnitude >= 1_000, thousands, units))
+
+def _bar_figure(series, categoria, title="", cumulative=False):
+    # A category with no rows in [START, END] has no entries and is drawn as an empty chart.
+    empty = pd.Series(dtype="float32")
+    budget_data = series.get((categoria, "Budget", cumulative), empty)
+    actual_data = series.get((categoria, "Actual", cumulative), empty)
+    forecast_data = series.get((categoria, "Forecast", cumulative), empty)
 
     # <<< MUDANÇA: Define a precisão dos decimais com base na categoria do gráfico >>>
     # AuM terá 0 casas decimais, os outros terão 1.
     decimals = 0 if categoria == "AuM at the EoP" else 1
 
-    fig = go.Figure()
+    # Traces and layout are plain dicts so the figure is validated once, in the go.Figure constructor.
+    # Styling comes from the "dash" Plotly template.
+    traces = []
+    annotations = []
     
     if not actual_data.empty:
-        actual_text = [format_number(x, decimals=decimals) for x in actual_data]
-        fig.add_trace(go.Bar(x=actual_data.index, y=actual_data, name="Actual", marker_color="steelblue", text=actual_text, textposition='inside'))
+        actual_text = _format_series(actual_data.to_numpy(), decimals=decimals)
+        traces.append(dict(type="bar", x=actual_data.index, y=actual_data.to_numpy(), name="Actual", marker_color="steelblue", text=actual_text))
     
     if not forecast_data.empty:
-        forecast_text = [format_number(x, decimals=decimals) for x in forecast_data]
-        fig.add_trace(go.Bar(x=forecast_data.index, y=forecast_data, name="Forecast", marker_color="lightblue", text=forecast_text, textposition='inside'))
+        forecast_text = _format_series(forecast_data.to_numpy(), decimals=decimals)
+        traces.append(dict(type="bar", x=forecast_data.index, y=forecast_data.to_numpy(), name="Forecast", marker_color="lightblue", text=forecast_text))
     
     if not budget_data.empty:
-        fig.add_trace(go.Scatter(
-            x=budget_data.index, 
-            y=budget_data, 
-            mode="lines", 
-            name="Budget", 
-            line=dict(color="black", width=2, dash="dash")
-        ))
+        traces.append(dict(type="scatter", x=budget_data.index, y=budget_data.to_numpy(), name="Budget"))
         
-        for date, value in budget_data.items():
-            fig.add_annotation(
-                x=date,
-                y=value,
-                text=format_number(value, decimals=decimals), # Usa a precisão definida
-                showarrow=False,
-                yshift=15,
-                font=dict(
-                    color="black",
-                    size=12
-                ),
-                bgcolor="rgba(255, 255, 255, 0.6)",
-                borderpad=2
-            )
+        budget_text = _format_series(budget_data.to_numpy(), decimals=decimals) # Usa a precisão definida
+        for date, value, text in zip(budget_data.index, budget_data, budget_text):
+            annotations.append(dict(x=date, y=value, text=text))
     
-    fig.update_layout(
-        title=title, 
-        barmode="overlay", 
-        xaxis_title="Month", 
-        xaxis=dict(tickformat="%b/%y", showgrid=False),
-        yaxis=dict(visible=False, showgrid=False),
-        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1)
-    )
+    layout = dict(title=title, annotations=annotations)
     
-    fig.update_traces(textangle=0, insidetextanchor='middle', textfont=dict(color='white', size=14), selector=dict(type='bar'))
-    st.plotly_chart(fig, use_container_width=True, key=key)
+    return go.Figure(data=traces, layout=layout)
+
+# A data version yields six charts (three per page); old versions are evicted instead of piling up.
+@st.cache_data(show_spinner=False, max_entries=12)
+def _figure_json(source, categoria, title, cumulative, version):
+    """Builds a chart once per data version and returns its serialized Plotly JSON.
+
+    bar_compare still rebuilds a go.Figure from this JSON and st.plotly_chart serializes it again
+    on every render; what the cache saves is looking up the series and assembling the traces.
+    """
+    return _bar_figure(load_data(version)[source], categoria, title, cumulative).to_json()
+
+def bar_compare(source, categoria, title="", key=None, cumulative=False):
+    fig = pio.from_json(_figure_json(source, categoria, title, cumulative, data_version()))
+    st.plotly_chart(fig, use_container_width=True, key=key, config={"responsive": True})
 
 # ===================================================================
 # INTERACTIVE MODE PAGES
@@ -132,54 +242,44 @@ def page_dashboard():
     with col2:
         display_logo()
 
-    df_budg, df_aum = load_data()
-    
     st.subheader("🔹 Balance Sheet Statistics")
-    bar_compare(df_aum, "AuM at the EoP", "AuM (BRL)", key="dash_aum")
+    bar_compare("aum", "AuM at the EoP", "AuM (BRL)", key="dash_aum")
     
     st.subheader("🔹 Income Statement Statistics")
     c5, c6 = st.columns(2)
     with c5:
-        bar_compare(df_budg, "Revenues - Net of ECL", "Revenues inc. CDBs (BRL)", key="dash_revenues")
+        bar_compare("budg", "Revenues - Net of ECL", "Revenues inc. CDBs (BRL)", key="dash_revenues")
     with c6:
-        bar_compare(df_budg, "PROFIT BEFORE TAX", "Profit Before Taxes (BRL)", key="dash_pbt")
+        bar_compare("budg", "PROFIT BEFORE TAX", "Profit Before Taxes (BRL)", key="dash_pbt")
 
 # ===================================================================
 # "TV MODE" PAGE (IMMERSIVE VERSION)
 # ===================================================================
 
+@st.cache_data(show_spinner=False)
 def get_image_as_base64(file, width=150):
-    """Converts an image file to a base64 string to embed in HTML."""
-    try:
-        img = Image.open(file)
-        aspect_ratio = img.width / img.height
-        new_height = int(width / aspect_ratio)
-        resized_img = img.resize((width, new_height))
-        
-        buffered = BytesIO()
-        resized_img.save(buffered, format="PNG")
-        return base64.b64encode(buffered.getvalue()).decode()
-    except FileNotFoundError:
-        return None
-
-def page_tv_mode():
-    """Runs the automatic, full-screen presentation mode."""
+    """Converts an image file to a base64 string and the <img> tag that embeds it in HTML."""
+    # A missing file raises instead of returning None: exceptions are not cached, so a logo added
+    # after startup is picked up on the next rerun.
+    resized_img = load_logo(file, width)
     
-    if st.button("Exit TV Mode", key="exit_tv"):
-        st.session_state.tv_mode_on = False
-        st.rerun()
-
-    logo_base64 = get_image_as_base64(LOGO_FILE)
+    buffered = BytesIO()
+    resized_img.save(buffered, format="PNG")
+    img_base64 = base64.b64encode(buffered.getvalue()).decode()
+    return img_base64, f'<img src="data:image/png;base64,{img_base64}">'
 
-    st.markdown(f"""
+@st.cache_data(show_spinner=False)
+def _tv_header_html(logo_img):
+    """Builds the TV Mode style block and logo container once, so reruns reuse the same HTML."""
+    html = """
         <style>
             /* Hide Streamlit UI */
-            [data-testid="stSidebar"], [data-testid="stHeader"], [data-testid="stToolbar"] {{
+            [data-testid="stSidebar"], [data-testid="stHeader"], [data-testid="stToolbar"] {
                 display: none;
-            }}
+            }
             
             /* Create a full-screen container to prevent scrolling */
-            .main .block-container {{
+            .main .block-container {
                 display: flex;
                 flex-direction: column;
                 justify-content: center; /* Vertically center content */
@@ -189,61 +289,60 @@ def page_tv_mode():
                 padding: 2rem;
                 background-color: #FFFFFF; /* Solid background to hide artifacts */
                 box-sizing: border-box;
-            }}
+            }
 
             /* Position the exit button */
-            div[data-testid="stButton"] > button[kind="secondary"] {{
+            div[data-testid="stButton"] > button[kind="secondary"] {
                 position: fixed;
                 top: 2rem;
                 left: 2rem;
                 z-index: 1001;
-            }}
+            }
 
             /* Position the logo */
-            .logo-container {{
+            .logo-container {
                 position: fixed;
                 top: 2rem;
                 right: 2rem;
                 z-index: 1000;
-            }}
+            }
         </style>
-        """, unsafe_allow_html=True)
+        """
+    if logo_img:
+        html += f"""
+        <div class="logo-container">
+            {logo_img}
+        </div>
+        """
+    return html
 
-    if logo_base64:
-        st.markdown(f"""
-            <div class="logo-container">
-                <img src="data:image/png;base64,{logo_base64}">
-            </div>
-            """, unsafe_allow_html=True)
+@st.fragment(run_every=DELAY)
+def _tv_chart_fragment():
+    """Shows the current TV Mode view and advances to the next one; only this fragment reruns every DELAY seconds."""
+    title, source, categoria, is_cumulative = VIEWS[st.session_state.view_index]
+    st.title(title)
+    unique_key = f"tv_view_{st.session_state.view_index}"
+    bar_compare(source=source, categoria=categoria, title="", key=unique_key, cumulative=is_cumulative)
 
-    DELAY = 15 
-    df_budg, df_aum = load_data()
+    st.session_state.view_index = (st.session_state.view_index + 1) % len(VIEWS)
+
+def page_tv_mode():
+    """Runs the automatic, full-screen presentation mode."""
     
-    views = []
-    views.append({'type': 'chart', 'title': 'AuM (BRL)', 'params': {'df': df_aum, 'categoria': 'AuM at the EoP'}})
-    views.append({'type': 'chart', 'title': 'Revenues inc. CDBs (BRL)', 'params': {'df': df_budg, 'categoria': 'Revenues - Net of ECL'}})
-    views.append({'type': 'chart', 'title': 'Profit Before Taxes (BRL)', 'params': {'df': df_budg, 'categoria': 'PROFIT BEFORE TAX'}})
-        
+    if st.button("Exit TV Mode", key="exit_tv"):
+        st.session_state.tv_mode_on = False
+        st.rerun()
+
+    try:
+        _, logo_img = get_image_as_base64(LOGO_FILE)
+    except FileNotFoundError:
+        logo_img = None
+    st.markdown(_tv_header_html(logo_img), unsafe_allow_html=True)
+
     if 'view_index' not in st.session_state:
         st.session_state.view_index = 0
 
-    placeholder = st.empty()
-    
-    iteration_counter = 0
-    while True:
-        current_view = views[st.session_state.view_index]
-        
-        with placeholder.container():
-            st.title(current_view['title'])
-            unique_key = f"tv_view_{st.session_state.view_index}_{iteration_counter}"
-            
-            is_cumulative = current_view['params'].get('cumulative', False)
-            bar_compare(df=current_view['params']['df'], categoria=current_view['params']['categoria'], title="", key=unique_key, cumulative=is_cumulative)
-
-        st.session_state.view_index = (st.session_state.view_index + 1) % len(views)
-        iteration_counter += 1
-        
-        time.sleep(DELAY)
+    _tv_chart_fragment()
 
 # ===================================================================
 # MAIN NAVIGATION STRUCTURE